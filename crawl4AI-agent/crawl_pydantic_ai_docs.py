@@ -2,20 +2,39 @@ import os
 import sys
 import json
 import asyncio
+import hashlib
+import time
 import requests
 from xml.etree import ElementTree
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from urllib.parse import urlparse
 from dotenv import load_dotenv
 
 from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig, CacheMode
-from openai import AsyncOpenAI
+from openai import AsyncOpenAI, BadRequestError
 from supabase import create_client, Client
 
 load_dotenv()
 
+# Max number of inputs sent in a single embeddings request
+EMBEDDING_BATCH_SIZE = 100
+
+# Max number of OpenAI requests started per minute, set it to your account's RPM limit.
+# Requests are spaced evenly so the crawl's fan-out doesn't trip 429s.
+OPENAI_RPM = int(os.getenv("OPENAI_RPM") or 500)
+next_openai_request_time = 0.0
+
+# Max number of OpenAI requests in flight at once. The slots are shared by all pages crawled
+# concurrently, so each page's summaries and embedding batches queue behind the others'.
+MAX_CONCURRENT_OPENAI_REQUESTS = int(os.getenv("OPENAI_MAX_CONCURRENT_REQUESTS") or 10)
+openai_semaphore = asyncio.Semaphore(MAX_CONCURRENT_OPENAI_REQUESTS)
+
+# Embeddings computed or in flight during this crawl, keyed by SHA-256 of the chunk text.
+# Holding futures lets pages crawled concurrently await one request for a shared chunk.
+embedding_cache: Dict[str, asyncio.Future] = {}
+
 # Initialize OpenAI and Supabase clients
 openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 supabase: Client = create_client(
@@ -78,6 +97,14 @@ def chunk_text(text: str, chunk_size: int = 5000) -> List[str]:
 
     return chunks
 
+async def wait_for_openai_rate_limit():
+    """Wait for the next free slot so no more than OPENAI_RPM requests are started per minute."""
+    global next_openai_request_time
+    now = time.monotonic()
+    start_time = max(now, next_openai_request_time)
+    next_openai_request_time = start_time + 60 / OPENAI_RPM
+    await asyncio.sleep(start_time - now)
+
 async def get_title_and_summary(chunk: str, url: str) -> Dict[str, str]:
     """Extract title and summary using GPT-4."""
     system_prompt = """You are an AI that extracts titles and summaries from documentation chunks.
@@ -87,39 +114,82 @@ async def get_title_and_summary(chunk: str, url: str) -> Dict[str, str]:
     Keep both title and summary concise but informative."""
     
     try:
-        response = await openai_client.chat.completions.create(
-            model=os.getenv("LLM_MODEL", "gpt-4o-mini"),
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"URL: {url}\n\nContent:\n{chunk[:1000]}..."}  # Send first 1000 chars for context
-            ],
-            response_format={ "type": "json_object" }
-        )
+        await wait_for_openai_rate_limit()
+        async with openai_semaphore:
+            response = await openai_client.chat.completions.create(
+                model=os.getenv("LLM_MODEL", "gpt-4o-mini"),
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": f"URL: {url}\n\nContent:\n{chunk[:1000]}..."}  # Send first 1000 chars for context
+                ],
+                response_format={ "type": "json_object" }
+            )
         return json.loads(response.choices[0].message.content)
     except Exception as e:
         print(f"Error getting title and summary: {e}")
         return {"title": "Error processing title", "summary": "Error processing summary"}
 
-async def get_embedding(text: str) -> List[float]:
-    """Get embedding vector from OpenAI."""
+async def get_embeddings(texts: List[str]) -> List[List[float]]:
+    """Get embedding vectors from OpenAI, sending the distinct uncached texts in batched requests."""
+    # Key chunks by content hash, so boilerplate repeated across pages is only embedded once.
+    # Hashes not seen yet get a future right away, so other pages wait on this call's request.
+    hashes = [hashlib.sha256(text.encode("utf-8")).hexdigest() for text in texts]
+    loop = asyncio.get_running_loop()
+    missing = {}
+    for text_hash, text in zip(hashes, texts):
+        if text_hash not in embedding_cache:
+            embedding_cache[text_hash] = loop.create_future()
+            missing[text_hash] = text
+    futures = [embedding_cache[text_hash] for text_hash in hashes]
+    missing_hashes = list(missing)
+    missing_texts = list(missing.values())
+    batches = [
+        missing_texts[i:i + EMBEDDING_BATCH_SIZE]
+        for i in range(0, len(missing_texts), EMBEDDING_BATCH_SIZE)
+    ]
+
+    async def embed_batch(batch: List[str]) -> List[Optional[List[float]]]:
+        try:
+            await wait_for_openai_rate_limit()
+            async with openai_semaphore:
+                response = await openai_client.embeddings.create(
+                    model="text-embedding-3-small",
+                    input=batch
+                )
+            return [item.embedding for item in response.data]
+        except BadRequestError as e:
+            print(f"Error getting embeddings: {e}")
+            if len(batch) == 1:
+                return [None]
+            # The request was rejected for its input, so retry one text at a time
+            # to keep a single bad input from nulling out the rest of the batch
+            results = await asyncio.gather(*[embed_batch([text]) for text in batch])
+            return [result[0] for result in results]
+        except Exception as e:
+            # Rate limits, timeouts and server errors are already retried by the client,
+            # splitting the batch here would only multiply the failing requests
+            print(f"Error getting embeddings: {e}")
+            return [None] * len(batch)
+
+    new_embeddings = [None] * len(missing_hashes)
     try:
-        response = await openai_client.embeddings.create(
-            model="text-embedding-3-small",
-            input=text
-        )
-        return response.data[0].embedding
-    except Exception as e:
-        print(f"Error getting embedding: {e}")
-        return [0] * 1536  # Return zero vector on error
+        results = await asyncio.gather(*[embed_batch(batch) for batch in batches])
+        new_embeddings = [embedding for batch in results for embedding in batch]
+    finally:
+        # Always resolve the futures, so pages waiting on them can't hang
+        for text_hash, embedding in zip(missing_hashes, new_embeddings):
+            embedding_cache[text_hash].set_result(embedding)
+            if embedding is None:  # Don't cache failures so later pages retry them
+                del embedding_cache[text_hash]
 
-async def process_chunk(chunk: str, chunk_number: int, url: str) -> ProcessedChunk:
-    """Process a single chunk of text."""
-    # Get title and summary
-    extracted = await get_title_and_summary(chunk, url)
-    
-    # Get embedding
-    embedding = await get_embedding(chunk)
-    
+    embeddings = await asyncio.gather(*futures)
+    return [
+        embedding if embedding is not None else [0] * 1536  # Return zero vector on error
+        for embedding in embeddings
+    ]
+
+def process_chunk(chunk: str, chunk_number: int, url: str, extracted: Dict[str, str], embedding: List[float]) -> ProcessedChunk:
+    """Assemble a processed chunk from its title/summary and embedding."""
     # Create metadata
     metadata = {
         "source": "pydantic_ai_docs",
@@ -160,15 +230,22 @@ async def insert_chunk(chunk: ProcessedChunk):
 
 async def process_and_store_document(url: str, markdown: str):
     """Process a document and store its chunks in parallel."""
-    # Split into chunks
-    chunks = chunk_text(markdown)
+    # Split into chunks, dropping empty ones the embeddings endpoint would reject
+    chunks = [chunk for chunk in chunk_text(markdown) if chunk.strip()]
     
-    # Process chunks in parallel
-    tasks = [
-        process_chunk(chunk, i, url) 
+    # Get titles/summaries in parallel while all chunks are embedded in batched requests
+    summary_tasks = [
+        get_title_and_summary(chunk, url) 
+        for chunk in chunks
+    ]
+    extracted, embeddings = await asyncio.gather(
+        asyncio.gather(*summary_tasks),
+        get_embeddings(chunks)
+    )
+    processed_chunks = [
+        process_chunk(chunk, i, url, extracted[i], embeddings[i])
         for i, chunk in enumerate(chunks)
     ]
-    processed_chunks = await asyncio.gather(*tasks)
     
     # Store chunks in parallel
     insert_tasks = [
@@ -1,32 +1,61 @@
-from langchain_community.document_loaders import DirectoryLoader, PyPDFLoader
+from langchain_community.document_loaders import PyPDFium2Loader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_huggingface import HuggingFaceEmbeddings
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
 from langchain_community.vectorstores import Chroma
 from dotenv import load_dotenv
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
 import os
 import shutil
+import sys
 
 load_dotenv()
 
-def load_and_process_pdfs(data_dir: str):
-    """Load PDFs from directory and split into chunks."""
-    loader = DirectoryLoader(
-        data_dir,
-        glob="**/*.pdf",
-        loader_cls=PyPDFLoader
-    )
-    documents = loader.load()
-    
-    # Split documents into chunks
+def load_and_split_pdf(pdf_path: str):
+    """Load a single PDF page by page and split it into chunks."""
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=1000,
         chunk_overlap=200,
         length_function=len,
     )
-    chunks = text_splitter.split_documents(documents)
-    return chunks
+    # Split one page at a time so each page's text can be freed once it is chunked,
+    # and only the chunks are sent back to the parent process
+    return [
+        chunk
+        for page in PyPDFium2Loader(pdf_path).lazy_load()
+        for chunk in text_splitter.split_documents([page])
+    ]
+
+def load_and_process_pdfs(data_dir: str, executor: ProcessPoolExecutor):
+    """Start loading PDFs from directory in parallel and yield each file's path and chunks as it finishes.
+
+    The chunks are None for a file that failed to load.
+    """
+    pdf_paths = [str(path) for path in Path(data_dir).glob("**/*.pdf")]
+    if not pdf_paths:
+        print(f"No PDFs found in {data_dir}")
+
+    # Text extraction is CPU-bound and PDFium is not thread-safe,
+    # so spread the files across worker processes. Submitting them all now lets
+    # extraction run while the embedding model loads and earlier files are stored.
+    futures = {executor.submit(load_and_split_pdf, pdf_path): pdf_path for pdf_path in pdf_paths}
+
+    def completed_chunks():
+        for future in as_completed(futures):
+            pdf_path = futures[future]
+            try:
+                yield pdf_path, future.result()
+            except Exception as e:
+                # Results are consumed after the old vector store has been cleared,
+                # so skip an unreadable PDF instead of aborting with a partial store
+                print(f"Error loading {pdf_path}: {e}")
+                yield pdf_path, None
+
+    return completed_chunks()
 
-def create_vector_store(chunks, persist_directory: str):
+def create_vector_store(chunk_batches, persist_directory: str, cache_directory: str):
     """Create and persist Chroma vector store."""
     # Clear existing vector store if it exists
     if os.path.exists(persist_directory):
@@ -34,33 +63,63 @@ def create_vector_store(chunks, persist_directory: str):
         shutil.rmtree(persist_directory)
     
     # Initialize HuggingFace embeddings
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-mpnet-base-v2",
+    model_name = "sentence-transformers/all-mpnet-base-v2"
+    underlying_embeddings = HuggingFaceEmbeddings(
+        model_name=model_name,
         model_kwargs={'device': 'cpu'}
     )
+
+    # Cache embeddings on disk keyed by a hash of the chunk text, so re-ingesting
+    # unchanged documents only embeds chunks that haven't been seen before
+    embeddings = CacheBackedEmbeddings.from_bytes_store(
+        underlying_embeddings,
+        LocalFileStore(cache_directory),
+        namespace=model_name
+    )
     
     # Create and persist Chroma vector store
     print("Creating new vector store...")
-    vectordb = Chroma.from_documents(
-        documents=chunks,
-        embedding=embeddings,
+    vectordb = Chroma(
+        embedding_function=embeddings,
         persist_directory=persist_directory
     )
-    return vectordb
+
+    # Embed and store each file's chunks as soon as they arrive,
+    # while the remaining PDFs are still being extracted. Chroma rejects upserts
+    # over its max batch size, which one large PDF can exceed, so add in slices.
+    max_batch_size = vectordb._client.get_max_batch_size()
+    chunk_count = 0
+    failed_paths = []
+    for pdf_path, chunks in chunk_batches:
+        if chunks is None:
+            failed_paths.append(pdf_path)
+            continue
+        for i in range(0, len(chunks), max_batch_size):
+            vectordb.add_documents(chunks[i:i + max_batch_size])
+        chunk_count += len(chunks)
+    print(f"Created {chunk_count} chunks from PDFs")
+    if failed_paths:
+        print(f"Skipped {len(failed_paths)} PDF(s) that failed to load: {', '.join(failed_paths)}")
+    return vectordb, chunk_count
 
 def main():
     # Define directories
     data_dir = os.path.join(os.path.dirname(__file__), "data")
     db_dir = os.path.join(os.path.dirname(__file__), "chroma_db")
+    cache_dir = os.path.join(os.path.dirname(__file__), "embedding_cache")
     
-    # Process PDFs
-    print("Loading and processing PDFs...")
-    chunks = load_and_process_pdfs(data_dir)
-    print(f"Created {len(chunks)} chunks from PDFs")
-    
-    # Create vector store
-    print("Creating vector store...")
-    vectordb = create_vector_store(chunks, db_dir)
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        # Process PDFs
+        print("Loading and processing PDFs...")
+        chunk_batches = load_and_process_pdfs(data_dir, executor)
+
+        # Create vector store
+        print("Creating vector store...")
+        vectordb, chunk_count = create_vector_store(chunk_batches, db_dir, cache_dir)
+
+    if chunk_count == 0:
+        print(f"No chunks were ingested, the vector store at {db_dir} is empty")
+        sys.exit(1)
     print(f"Vector store created and persisted at {db_dir}")
 
 if __name__ == "__main__":